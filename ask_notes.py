@@ -1,44 +1,163 @@
-import json
-import faiss
-import requests
-import numpy as np
 import re
 import os
-from ls import list_dir 
+import difflib
+import ollama_client
+from concurrent.futures import ThreadPoolExecutor
+from ls import list_dir_cached
+from rerank import rerank
+from shards import ShardSet, load_registry
+from snapshots import IndexMismatchError
 
 # ---------------------------
 # CONFIG
 # ---------------------------
 LLM_MODEL = "qwen2.5:3b-instruct"
 EMBED_MODEL = "nomic-embed-text"
+SNAPSHOT_DIR = "snapshots/notes"
+DOCUMENT_SNAPSHOT_DIR = "snapshots/documents"
+# Legacy in-place files, read only until the first snapshot is built
 FAISS_INDEX_PATH = "index.faiss"
 DOCUMENT_FAISS_INDEX_PATH = "documents_index.faiss"
 META_PATH = "metadata.json"
 DOCUMENT_META_PATH = "documents_metadata.json"
+DOCUMENTS_PATH = "/home/ethan-silverthorne/Documents/Sync Vault/4 - Documents"  # used when no documents shard is registered
 TOP_K = 5
-OLLAMA_URL = "http://localhost:11434"
+PICKER_LIMIT = 15
+FUZZY_CUTOFF = 0.6
+CANDIDATE_K = 50  # over-fetched neighbours handed to the re-ranker
+RERANK = True
+
+SCHEDULE_WORDS = {"schedule", "plan", "planned", "meeting", "appointment", "time", "class", "work"}
+SUMMARY_WORDS = {"summary", "summaries", "summarize", "overview", "recap"}
+
+_shards = None
+_documents = None
+_pool = ThreadPoolExecutor(max_workers=4)
 
 # ---------------------------
 # UTILS
 # ---------------------------
 def embed(text):
-    res = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
-        json={"model": EMBED_MODEL, "prompt": text}
-    )
-    return res.json()["embedding"]
+    return ollama_client.embed(text, EMBED_MODEL)
 
 
 def chat(prompt):
-    res = requests.post(
-        f"{OLLAMA_URL}/api/generate",
-        json={
-            "model": LLM_MODEL,
-            "prompt": prompt,
-            "stream": False
-        }
+    return ollama_client.chat(prompt, LLM_MODEL)
+
+
+def get_shards():
+    # Shards come from shards.json; without one the default notes snapshot is served
+    global _shards
+    if _shards is None:
+        _shards = ShardSet.from_registry("notes", embed_model=EMBED_MODEL)
+        if not _shards.loaded():
+            _shards.load("notes", SNAPSHOT_DIR, FAISS_INDEX_PATH, META_PATH)
+    else:
+        _shards.refresh()
+    return _shards
+
+
+def semantic_search(shards, question, doc_type, q_vec=None):
+    return [h.meta for h in semantic_hits(shards, question, doc_type, q_vec)]
+
+
+def semantic_hits(shards, question, doc_type, q_vec=None):
+    q_vec = q_vec if q_vec is not None else embed(question)
+    hits = shards.search(q_vec, CANDIDATE_K if RERANK else TOP_K, doc_type)
+
+    if RERANK:
+        order = rerank(
+            question, q_vec,
+            [h.vector() for h in hits],
+            [h.meta for h in hits],
+            TOP_K
+        )
+        hits = [hits[j] for j in order]
+
+    return hits[:TOP_K]
+
+
+def document_shards():
+    return {
+        name: cfg for name, cfg in load_registry().items()
+        if cfg.get("kind") == "documents"
+    }
+
+
+def document_vaults():
+    return [cfg["vault"] for cfg in document_shards().values()] or [DOCUMENTS_PATH]
+
+
+def list_documents():
+    files = []
+    for vault in document_vaults():
+        files.extend(list_dir_cached(vault))
+    return files
+
+
+def get_documents():
+    # Filename indexes of the documents shards from index_documents.py; without a
+    # registered one the default documents snapshot is served
+    global _documents
+    if _documents is not None:
+        _documents.refresh()
+        return _documents
+
+    documents = ShardSet.from_registry("documents", embed_model=EMBED_MODEL)
+    if not document_shards():
+        try:
+            documents.load(
+                "documents", DOCUMENT_SNAPSHOT_DIR, DOCUMENT_FAISS_INDEX_PATH, DOCUMENT_META_PATH,
+                vault=DOCUMENTS_PATH
+            )
+        except FileNotFoundError:
+            pass
+    # Only cached once something is served, so a later index_documents.py run is picked up
+    if documents.loaded():
+        _documents = documents
+    return documents
+
+
+def fuzzy_score(query, path):
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    query = query.lower()
+    if query in name:
+        return 1.0
+    words = re.findall(r"[a-z0-9]+", name) or [name]
+    return max(
+        difflib.SequenceMatcher(None, query, candidate).ratio()
+        for candidate in [name] + words
     )
-    return res.json()["response"]
+
+
+def document_path(hit):
+    return os.path.join(hit.shard.vault, hit.meta["path"])
+
+
+def search_documents(query):
+    files = list_documents()
+
+    # ---- 1. Fuzzy filename match ----
+    scored = sorted(((fuzzy_score(query, f), f) for f in files), key=lambda x: -x[0])
+    matches = [f for score, f in scored if score >= FUZZY_CUTOFF]
+
+    # ---- 2. Semantic match on the filename index ----
+    # Optional: fuzzy matches still come back when ollama or the index is unusable
+    try:
+        documents = get_documents()
+        hits = documents.search(embed(query), PICKER_LIMIT) if documents.loaded() else []
+    except (ollama_client.OllamaError, IndexMismatchError, FileNotFoundError) as e:
+        print(f"Semantic document search unavailable, showing filename matches only ({e})")
+        hits = []
+
+    known = set(files)
+    for hit in hits:
+        path = document_path(hit)
+        # skip files deleted since the index was built
+        if path in known and path not in matches:
+            matches.append(path)
+
+    return matches[:PICKER_LIMIT]
 
 
 def extract_iso_date(text):
@@ -53,15 +172,12 @@ def extract_weeks(text):
 # ---------------------------
 # Workouts
 # ---------------------------
-def ask_workouts(question):
-    index = faiss.read_index(FAISS_INDEX_PATH)
-    with open(META_PATH, "r") as f:
-        metadata = json.load(f)
-
-    allowed_indices = [
-        i for i, m in enumerate(metadata)
-        if m.get("type") == "workouts"
-    ]
+def ask_workouts(question, metadata=None):
+    # ask_auto passes the rows its lookups already matched
+    shards = None
+    if metadata is None:
+        shards = get_shards()
+        metadata = shards.metadata()
 
     # ---- 1. Exact-date lookup ----
     query_date = extract_iso_date(question)
@@ -93,27 +209,7 @@ Question:
         print("\nAnswer:\n", chat(prompt))
         return
 
-    # ---- 2. Week-based lookup (single or multiple weeks) ----def ask_document(path, question):
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    prompt = f"""
-You are answering questions about a single document.
-
-Rules:
-- Use ONLY the document content below.
-- Do NOT invent information.
-- If the answer is not present, say so.
-- Preserve exact wording when relevant.
-
-Document:
-<<<
-{content}
->>>
-
-Question:
-{question}
-"""
+    # ---- 2. Week-based lookup (single or multiple weeks) ----
     weeks = extract_weeks(question)
 
     if weeks:
@@ -172,17 +268,8 @@ Question:
 
     # ---- 3. Semantic fallback (last resort) ----
     context = []
-    q_vec = embed(question)
-    D, I = index.search(
-        np.array([q_vec]).astype("float32"),
-        TOP_K
-    )
-
     print("Semantic retrieval:")
-    for idx in I[0]:
-        if idx not in allowed_indicies:
-            continue
-        m = metadata[idx]
+    for m in semantic_search(shards or get_shards(), question, "workouts"):
         context.append(m["text"])
         print(m["file"], m["date"], m.get("path", ""))
 
@@ -208,16 +295,13 @@ Question:
 ### workout summaries
 #########################
 
-def ask_workout_summaries(question):
-    index = faiss.read_index(FAISS_INDEX_PATH)
-    with open(META_PATH, "r") as f:
-        metadata = json.load(f)
+def ask_workout_summaries(question, metadata=None):
+    # ask_auto passes the rows its lookups already matched
+    shards = None
+    if metadata is None:
+        shards = get_shards()
+        metadata = shards.metadata()
     
-    allowed_indices = [
-        i for i, m in enumerate(metadata)
-        if m.get("type") == "workouts-summary"
-    ] 
-
     # ---- 2. Week-based lookup (single or multiple weeks) ----
     weeks = extract_weeks(question)
 
@@ -277,17 +361,8 @@ Question:
 
     # ---- 3. Semantic fallback (last resort) ----
     context = []
-    q_vec = embed(question)
-    D, I = index.search(
-        np.array([q_vec]).astype("float32"),
-        TOP_K
-    )
-
     print("Semantic retrieval:")
-    for idx in I[0]:
-        if idx not in allowed_indices:
-            continue
-        m = metadata[idx]
+    for m in semantic_search(shards or get_shards(), question, "workouts-summary"):
         context.append(m["text"])
         print(m["file"], m["date"], m.get("path", ""))
 
@@ -313,15 +388,12 @@ Question:
 ######    Schedule
 ##################################
 
-def ask_schedule(question):
-    index = faiss.read_index(FAISS_INDEX_PATH)
-    with open(META_PATH, "r") as f:
-        metadata = json.load(f)
-
-    allowed_indices = [
-        i for i, m in enumerate(metadata)
-        if m.get("type") == "schedule"
-    ]
+def ask_schedule(question, metadata=None):
+    # ask_auto passes the rows its lookups already matched
+    shards = None
+    if metadata is None:
+        shards = get_shards()
+        metadata = shards.metadata()
 
     # ---- 1. Exact-date lookup ----
     query_date = extract_iso_date(question)
@@ -357,17 +429,8 @@ Question:
 
     # ---- 3. Semantic fallback (last resort) ----
     context = []
-    q_vec = embed(question)
-    D, I = index.search(
-        np.array([q_vec]).astype("float32"),
-        TOP_K
-    )
-
     print("Semantic retrieval:")
-    for idx in I[0]:
-        if idx not in allowed_indicies:
-            continue
-        m = metadata[idx]
+    for m in semantic_search(shards or get_shards(), question, "schedule"):
         context.append(m["text"])
         print(m["file"], m["date"], m.get("path", ""))
 
@@ -384,6 +447,142 @@ Do NOT invent information.
 Context:
 {chr(10).join(context)}
 
+Question:
+{question}
+"""
+    print("\nAnswer:\n", chat(prompt))
+
+##################################
+######    Auto routing
+##################################
+
+def date_lookup(metadata, query_date):
+    hits = {}
+    if query_date:
+        for m in metadata:
+            if m.get("date") == query_date:
+                hits.setdefault(m.get("type"), []).append(m)
+    return hits
+
+
+def week_lookup(metadata, weeks):
+    hits = {}
+    if weeks:
+        for m in metadata:
+            path = m.get("path", "")
+            if any(f"Week {week}" in path for week in weeks):
+                hits.setdefault(m.get("type"), []).append(m)
+    return hits
+
+
+def document_name_lookup(question):
+    # A document whose name appears in the question, the longest name wins
+    text = question.lower()
+    named = []
+    for f in list_documents():
+        name = os.path.splitext(os.path.basename(f))[0].lower()
+        if len(name) >= 4 and name in text:
+            named.append((len(name), f))
+    return max(named)[1] if named else None
+
+
+def document_hits(q_vec):
+    # (distance, path) from the filename index, same fallbacks as the picker
+    try:
+        documents = get_documents()
+        hits = documents.search(q_vec, TOP_K) if documents.loaded() else []
+    except (IndexMismatchError, FileNotFoundError) as e:
+        print(f"Documents skipped in auto routing ({e})")
+        return []
+    known = set(list_documents())
+    return [(h.distance, document_path(h)) for h in hits if document_path(h) in known]
+
+
+def choose_route(question, date_hits, week_hits):
+    words = set(re.findall(r"[a-z]+", question.lower()))
+
+    # The matched rows go along so the chosen ask_* doesn't rescan a refreshed index
+    if date_hits.get("schedule") and (words & SCHEDULE_WORDS or not date_hits.get("workouts")):
+        return "schedule", ask_schedule, date_hits["schedule"]
+    if date_hits.get("workouts"):
+        return "workouts (exact date)", ask_workouts, date_hits["workouts"]
+
+    if week_hits.get("workouts-summary") and (words & SUMMARY_WORDS or not week_hits.get("workouts")):
+        return "workout weekly summaries", ask_workout_summaries, week_hits["workouts-summary"]
+    if week_hits.get("workouts"):
+        return "workouts (week)", ask_workouts, week_hits["workouts"]
+
+    return None, None, None
+
+
+def ask_auto(question):
+    shards = get_shards()
+    metadata = shards.metadata()
+
+    # The embedding round-trip starts now and overlaps with the metadata and
+    # filename lookups; vector search over the notes and the documents filename
+    # index runs as soon as it lands
+    embedding = ollama_client.submit(ollama_client.get_client().embed(question, EMBED_MODEL))
+    date_future = _pool.submit(date_lookup, metadata, extract_iso_date(question))
+    week_future = _pool.submit(week_lookup, metadata, extract_weeks(question))
+    name_future = _pool.submit(document_name_lookup, question)
+    vector_future = _pool.submit(
+        lambda: semantic_hits(shards, question, None, embedding.result())
+    )
+    document_future = _pool.submit(lambda: document_hits(embedding.result()))
+
+    def cancel_vector_search():
+        # Cancelling the embedding also ends the searches waiting on it,
+        # so none of them outlives this question
+        embedding.cancel()
+        vector_future.cancel()
+        document_future.cancel()
+
+    route, ask, rows = choose_route(question, date_future.result(), week_future.result())
+    if ask is not None:
+        # A direct date/week hit wins
+        cancel_vector_search()
+        print(f"Auto route: {route}")
+        ask(question, rows)
+        return
+
+    path = name_future.result()
+    if path:
+        # then a document named in the question
+        cancel_vector_search()
+        print(f"Auto route: document {os.path.basename(path)}")
+        ask_document(path, question)
+        return
+
+    # Both indexes use EMBED_MODEL, so a filename nearer than any note chunk
+    # means the question is about that document
+    hits = vector_future.result()
+    doc_hits = document_future.result()
+    if doc_hits and (not hits or doc_hits[0][0] < min(h.distance for h in hits)):
+        print(f"Auto route: document {os.path.basename(doc_hits[0][1])}")
+        ask_document(doc_hits[0][1], question)
+        return
+
+    print("Auto route: semantic retrieval")
+    context = []
+    for m in [h.meta for h in hits]:
+        context.append(f"[{m.get('type')}, {m.get('date')}, {m.get('file')}]\n{m['text']}")
+        print(m["file"], m.get("date"), m.get("path", ""))
+
+    if not context:
+        print("Not found in notes.")
+        return
+
+    prompt = f"""
+You are answering questions about personal notes: workout logs, a daily schedule and weekly workout summaries.
+
+Each context entry starts with its note type, date and file.
+Interpret the context below and answer the question.
+Do NOT invent information.
+
+Context:
+{chr(10).join(context)}
+
 Question:
 {question}
 """
@@ -392,7 +591,7 @@ Question:
 #############
 ## Document
 ############
-def ask_document(document, question):
+def ask_document(path, question):
     with open(path, "r", encoding="utf-8") as f:
         content = f.read()
         # print(content) debugging
@@ -414,9 +613,25 @@ def ask_document(document, question):
 
 if __name__ == "__main__":
     import sys
+    try:
+        ollama_client.warm_up(embed_model=EMBED_MODEL, llm_model=LLM_MODEL)
+    except ollama_client.OllamaError as e:
+        print(f"Warning: could not warm up models, is ollama serve running? ({e})")
+
+    # python ask_notes.py [shard ...] restricts queries to the given shards
+    if sys.argv[1:]:
+        loaded = [shard.name for shard in get_shards().loaded()]
+        unknown = [name for name in sys.argv[1:] if name not in loaded]
+        if unknown:
+            print(f"Unknown or unloaded shard(s): {', '.join(unknown)}. Loaded: {', '.join(loaded) or 'none'}")
+        # Only restrict when at least one name matched, rather than silently serving nothing
+        if len(unknown) < len(sys.argv[1:]):
+            for name in loaded:
+                if name not in sys.argv[1:]:
+                    get_shards().unload(name)
     while True:
         try:
-            choice = int(input("Is your query regarding\n1. Workouts\n2. Schedule\n3. Workout Weekly Summaries\n4. Documents\n"))
+            choice = int(input("Is your query regarding\n1. Workouts\n2. Schedule\n3. Workout Weekly Summaries\n4. Documents\n5. Auto (detect from question)\n"))
             if choice == 1:
                 prompt = input("What do you want to know")
                 ask_workouts(prompt)
@@ -427,7 +642,12 @@ if __name__ == "__main__":
                 prompt = input("What do you want to know")
                 ask_workout_summaries(prompt)
             elif choice == 4:
-                files = list_dir("/home/ethan-silverthorne/Documents/Sync Vault/4 - Documents")
+                query = input("Search documents (blank to list all): ").strip()
+                files = search_documents(query) if query else list_documents()
+                if not files:
+                    print("No matching documents.")
+                    continue
+
                 for i, f in enumerate(files):
                     print(f"{i}: {os.path.basename(f)}")
 
@@ -437,7 +657,14 @@ if __name__ == "__main__":
 
                 prompt = input("What do you want to know? ")
                 ask_document(path, prompt)
+            elif choice == 5:
+                prompt = input("What do you want to know? ")
+                ask_auto(prompt)
 
         except ValueError:
             print("Must be a valid number")
+        except ollama_client.OllamaError as e:
+            print(f"Ollama request failed: {e}")
+        except IndexMismatchError as e:
+            print(f"Index mismatch: {e}")
 
@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+from collections import Counter
+import faiss
+import numpy as np
+import index_notes
+from index_notes import HEADING_RE, chunker_config, make_chunks, normalize_metadata, parse_markdown, tokenize
+from ollama_client import embed_many, warm_up
+from shards import shard_config
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+TOP_K = 5
+CHUNKERS = [chunker_config("fixed"), chunker_config("markdown")]
+
+# Offline stats need no ollama. With --retrieval every heading in the vault
+# becomes a query ("heading + first line under it"); a hit is a top-k chunk
+# that contains that line, so chunkers that cut sections apart score lower.
+# Heading queries are shaped like the markdown chunker's boundaries and favour
+# it, so dated notes are also scored independently of headings: how many fit
+# in one chunk, and how often "What did I do on <date>?" retrieves the whole
+# note as a single chunk (what ask_notes' date lookups need).
+
+
+# ---------------------------
+# DATA
+# ---------------------------
+def load_notes(vault_path):
+    notes = []
+    for root, _, files in os.walk(vault_path):
+        for file in sorted(files):
+            if file.endswith(".md"):
+                meta, body = parse_markdown(os.path.join(root, file))
+                if body:
+                    notes.append((meta, body))
+    return notes
+
+
+def heading_queries(notes):
+    queries = []
+    for _, body in notes:
+        lines = body.splitlines()
+        for i, line in enumerate(lines):
+            match = HEADING_RE.match(line)
+            if not match:
+                continue
+            following = next((l.strip() for l in lines[i + 1:] if l.strip()), None)
+            if following and not HEADING_RE.match(following):
+                queries.append((f"{match.group(2)} {following}", following))
+    return queries
+
+
+def date_queries(notes):
+    # (query, position of the note in notes) for every note with a frontmatter date
+    queries = []
+    for n, (meta, _) in enumerate(notes):
+        note_date = normalize_metadata(meta.get("date"))
+        if note_date:
+            queries.append((f"What did I do on {note_date}?", n))
+    return queries
+
+
+# ---------------------------
+# METRICS
+# ---------------------------
+def chunk_stats(notes, chunker):
+    chunks = []
+    owners = []  # note position of every chunk
+    split_notes = 0
+    whole_dated = 0
+    dated = 0
+    source_tokens = 0
+
+    for n, (meta, body) in enumerate(notes):
+        note_chunks = make_chunks(body, chunker)
+        chunks.extend(note_chunks)
+        owners.extend([n] * len(note_chunks))
+        split_notes += len(note_chunks) > 1
+        if meta.get("date"):
+            dated += 1
+            whole_dated += len(note_chunks) == 1
+        source_tokens += len(tokenize(body))
+
+    sizes = [len(tokenize(c)) for c in chunks]
+    return chunks, {
+        "chunks": len(chunks),
+        "embedded_tokens": sum(sizes),
+        # tokens embedded more than once (overlap, repeated headings)
+        "overlap_waste": sum(sizes) - source_tokens,
+        "mean_tokens": round(float(np.mean(sizes)), 1) if sizes else 0,
+        "max_tokens": max(sizes, default=0),
+        "split_notes": f"{split_notes}/{len(notes)}",
+        # dated notes a date lookup gets back whole, whatever their structure
+        "whole_dated_notes": round(whole_dated / dated, 3) if dated else "n/a",
+    }, owners
+
+
+def retrieval_stats(chunks, owners, queries, dated_queries):
+    start = time.time()
+    vectors = embed_many(chunks, index_notes.EMBED_MODEL)
+    embed_seconds = time.time() - start
+
+    index = faiss.IndexFlatL2(len(vectors[0]))
+    index.add(np.array(vectors).astype("float32"))
+
+    stats = {"embed_seconds": round(embed_seconds, 1)}
+
+    if queries:
+        q_vecs = np.array(embed_many([q for q, _ in queries], index_notes.EMBED_MODEL)).astype("float32")
+        D, I = index.search(q_vecs, TOP_K)
+
+        hits = 0
+        reciprocal_ranks = []
+        context_tokens = []
+        for (_, target), ids in zip(queries, I):
+            ranks = [r for r, i in enumerate(ids) if i >= 0 and target in chunks[i]]
+            hits += bool(ranks)
+            reciprocal_ranks.append(1 / (ranks[0] + 1) if ranks else 0)
+            context_tokens.append(sum(len(tokenize(chunks[i])) for i in ids if i >= 0))
+
+        stats.update({
+            f"recall@{TOP_K}": round(hits / len(queries), 3),
+            "mrr": round(float(np.mean(reciprocal_ranks)), 3),
+            "context_tokens": round(float(np.mean(context_tokens)), 1),
+        })
+
+    if dated_queries:
+        q_vecs = np.array(embed_many([q for q, _ in dated_queries], index_notes.EMBED_MODEL)).astype("float32")
+        D, I = index.search(q_vecs, TOP_K)
+
+        note_chunks = Counter(owners)
+        found = 0
+        single = 0
+        for (_, note), ids in zip(dated_queries, I):
+            retrieved = [i for i in ids if i >= 0 and owners[i] == note]
+            found += bool(retrieved)
+            # the note is one chunk and that chunk came back: answerable from it alone
+            single += bool(retrieved) and note_chunks[note] == 1
+
+        stats.update({
+            f"date_recall@{TOP_K}": round(found / len(dated_queries), 3),
+            "date_single_chunk": round(single / len(dated_queries), 3),
+        })
+
+    return stats
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+if __name__ == "__main__":
+    # python benchmark_chunkers.py [shard] [--retrieval]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    retrieval = "--retrieval" in sys.argv
+    vault_path = shard_config(args[0], kind="notes")["vault"] if args else index_notes.VAULT_PATH
+
+    notes = load_notes(vault_path)
+    if not notes:
+        raise RuntimeError("No notes found. Check vault path or note contents.")
+
+    queries = heading_queries(notes) if retrieval else []
+    dated_queries = date_queries(notes) if retrieval else []
+    if retrieval:
+        warm_up(embed_model=index_notes.EMBED_MODEL, llm_model=None)
+        print(f"{len(notes)} notes, {len(queries)} heading queries, {len(dated_queries)} date queries\n")
+
+    for chunker in CHUNKERS:
+        chunks, stats, owners = chunk_stats(notes, chunker)
+        if queries or dated_queries:
+            stats.update(retrieval_stats(chunks, owners, queries, dated_queries))
+        print(index_notes.chunker_id(chunker))
+        for key, value in stats.items():
+            print(f"  {key:<16} {value}")
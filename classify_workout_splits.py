@@ -1,15 +1,18 @@
-import json
-import requests
 import sys
+from ollama_client import OllamaError, chat, warm_up
+from shards import shard_config
+from snapshots import StaleSnapshotError, load_snapshot, write_snapshot
 
 # ---------------------------
 # CONFIG
 # ---------------------------
+SNAPSHOT_DIR = "snapshots/notes"
+FAISS_INDEX_PATH = "index.faiss"  # legacy in-place files, used until the first snapshot exists
 META_PATH = "metadata.json"
-OLLAMA_URL = "http://localhost:11434"
 LLM_MODEL = "qwen2.5:3b-instruct"
 
 VALID_SPLITS = {"Push", "Pull", "Legs", "Mixed"}
+MAX_WRITE_ATTEMPTS = 3
 
 # ---------------------------
 # LLM CALL
@@ -31,23 +34,49 @@ Workout log:
 {workout_text}
 """
 
-    res = requests.post(
-        f"{OLLAMA_URL}/api/generate",
-        json={
-            "model": LLM_MODEL,
-            "prompt": prompt,
-            "stream": False
-        }
-    )
+    return chat(prompt, LLM_MODEL).strip()
+
+# ---------------------------
+# SNAPSHOT
+# ---------------------------
+def load(snapshot_dir):
+    if snapshot_dir == SNAPSHOT_DIR:
+        return load_snapshot(snapshot_dir, FAISS_INDEX_PATH, META_PATH)
+    return load_snapshot(snapshot_dir)
+
+
+def save_splits(snapshot_dir, index, metadata, manifest, splits):
+    # Classifying takes minutes, so a rebuild or migration may land meanwhile.
+    # Rather than re-pinning the stale index over it, the new splits are
+    # re-applied to the latest snapshot wherever the same chunk text still exists.
+    for attempt in range(MAX_WRITE_ATTEMPTS):
+        if attempt:
+            print("Index changed while classifying, re-applying splits to the latest snapshot")
+            index, metadata, manifest = load(snapshot_dir)
+            for entry in metadata:
+                text, split = splits.get((entry.get("path"), entry.get("chunk")), (None, None))
+                if split and entry.get("text") == text:
+                    entry["split"] = split
+
+        try:
+            # The unchanged index is re-pinned with the new metadata in a fresh snapshot
+            return write_snapshot(
+                snapshot_dir, index, metadata,
+                provenance=(manifest or {}).get("provenance"),
+                base_version=manifest["version"] if manifest else 0,
+            )
+        except StaleSnapshotError as e:
+            error = e
+
+    raise error
 
-    return res.json().get("response", "").strip()
 
 # ---------------------------
 # MAIN
 # ---------------------------
-def main(write=False):
-    with open(META_PATH, "r") as f:
-        metadata = json.load(f)
+def main(write=False, snapshot_dir=SNAPSHOT_DIR):
+    index, metadata, manifest = load(snapshot_dir)
+    splits = {}
 
     updated = 0
     skipped = 0
@@ -71,7 +100,12 @@ def main(write=False):
 
         print(f"\nClassifying: {entry.get('file')} ({entry.get('date')})")
 
-        split = classify_split(workout_text)
+        try:
+            split = classify_split(workout_text)
+        except OllamaError as e:
+            print(f"⚠️ Classification failed: {e} — skipping")
+            skipped += 1
+            continue
 
         if split not in VALID_SPLITS:
             print(f"⚠️ Invalid split returned: '{split}' — skipping")
@@ -82,12 +116,12 @@ def main(write=False):
 
         if write:
             entry["split"] = split
+            splits[(entry.get("path"), entry.get("chunk"))] = (entry.get("text"), split)
             updated += 1
 
     if write:
-        with open(META_PATH, "w") as f:
-            json.dump(metadata, f, indent=2)
-        print(f"\n✅ Updated {updated} entries.")
+        version = save_splits(snapshot_dir, index, metadata, manifest, splits)
+        print(f"\n✅ Updated {updated} entries (snapshot v{version}).")
     else:
         print(f"\nℹ️ Dry run complete. {updated} would be updated, {skipped} skipped.")
         print("Run with --write to persist changes.")
@@ -97,5 +131,12 @@ def main(write=False):
 # ---------------------------
 if __name__ == "__main__":
     write_flag = "--write" in sys.argv
-    main(write=write_flag)
+    shard_names = [a for a in sys.argv[1:] if not a.startswith("--")]
+    warm_up(embed_model=None, llm_model=LLM_MODEL)
+
+    # python classify_workout_splits.py [shard] [--write]
+    if shard_names:
+        main(write=write_flag, snapshot_dir=shard_config(shard_names[0], kind="notes")["snapshot_dir"])
+    else:
+        main(write=write_flag)
 
@@ -1,22 +1,22 @@
 import os
+import sys
 import yaml
 import faiss
-import json
-import requests
 import tiktoken
 import numpy as np
 from datetime import date, datetime
+from ollama_client import embed_many, warm_up
+from shards import shard_config
+from snapshots import write_snapshot
 
 # ---------------------------
 # CONFIG
 # ---------------------------
 VAULT_PATH = "/home/ethan-silverthorne/Documents/Sync Vault/4 - Documents"
 EMBED_MODEL = "nomic-embed-text"
-FAISS_INDEX_PATH = "documents_index.faiss"
-META_PATH = "documents_metadata.json"
+SNAPSHOT_DIR = "snapshots/documents"
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = 50
-OLLAMA_URL = "http://localhost:11434"
 
 # ---------------------------
 # UTILS
@@ -68,28 +68,20 @@ def parse_markdown(path):
 
 
 
-def embed(text):
-    res = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
-        json={"model": EMBED_MODEL, "prompt": text}
-    )
-    return res.json()["embedding"]
-
-
 # ---------------------------
 # INDEXING
 # ---------------------------
-def build_index():
-    vectors = []
+def build_index(vault_path=VAULT_PATH, snapshot_dir=SNAPSHOT_DIR):
+    embed_texts = []
     metadata = []
 
-    for root, _, files in os.walk(VAULT_PATH):
+    for root, _, files in os.walk(vault_path):
         for file in files:
             if not file.endswith(".md"):
                 continue
 
             full_path = os.path.join(root, file)
-            rel_path = os.path.relpath(full_path, VAULT_PATH)
+            rel_path = os.path.relpath(full_path, vault_path)
 
             # Build embedding text (THIS IS THE KEY CHANGE)
             embed_text = f"""
@@ -97,30 +89,39 @@ Filename: {file}
 Path: {rel_path}
 """
 
-            vector = embed(embed_text)
-            vectors.append(vector)
+            embed_texts.append(embed_text)
 
             metadata.append({
                 "file": file,
                 "path": rel_path,
                 "type": "filename",   # optional but useful
+                "embed_model": EMBED_MODEL,
             })
 
-    if not vectors:
+    if not embed_texts:
         raise RuntimeError("No files indexed.")
 
+    vectors = embed_many(embed_texts, EMBED_MODEL)
+
     dim = len(vectors[0])
     index = faiss.IndexFlatL2(dim)
     index.add(np.array(vectors).astype("float32"))
 
-    faiss.write_index(index, FAISS_INDEX_PATH)
-
-    with open(META_PATH, "w") as f:
-        json.dump(metadata, f, indent=2)
+    version = write_snapshot(
+        snapshot_dir, index, metadata,
+        provenance={"embed_model": EMBED_MODEL, "chunker": {"name": "filename"}}
+    )
 
-    print(f"Indexed {len(vectors)} filenames.")
+    print(f"Indexed {len(vectors)} filenames into snapshot v{version}.")
 
 if __name__ == "__main__":
-    build_index()
+    warm_up(embed_model=EMBED_MODEL, llm_model=None)
+
+    # python index_documents.py [shard] builds a shard registered in shards.json
+    if len(sys.argv) > 1:
+        cfg = shard_config(sys.argv[1], kind="documents")
+        build_index(cfg["vault"], cfg["snapshot_dir"])
+    else:
+        build_index()
 
 
@@ -1,22 +1,30 @@
 import os
+import re
+import sys
 import yaml
 import faiss
-import json
-import requests
 import tiktoken
 import numpy as np
 from datetime import date, datetime
+from ollama_client import embed_many, warm_up
+from shards import shard_config
+from snapshots import load_metadata, read_manifest, write_snapshot
 
 # ---------------------------
 # CONFIG
 # ---------------------------
 VAULT_PATH = "/home/ethan-silverthorne/Documents/Sync Vault/1 - Overview/Archive/2025/Quater 4/"
 EMBED_MODEL = "nomic-embed-text"
-FAISS_INDEX_PATH = "index.faiss"
-META_PATH = "metadata.json"
+SNAPSHOT_DIR = "snapshots/notes"
+META_PATH = "metadata.json"  # legacy in-place metadata, only read to carry enrichment over
+CHUNKER = "markdown"        # "markdown" (structure-aware) or "fixed" (token windows)
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = 50
-OLLAMA_URL = "http://localhost:11434"
+MD_MAX_TOKENS = 350
+MD_MIN_TOKENS = 80          # a heading only starts a new chunk once this much is collected
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
 
 # ---------------------------
 # UTILS
@@ -37,14 +45,187 @@ def detokenize(tokens):
     return enc.decode(tokens)
 
 
-def chunk_text(text):
+def chunk_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
     tokens = tokenize(text)
     chunks = []
-    for i in range(0, len(tokens), CHUNK_SIZE - CHUNK_OVERLAP):
-        chunks.append(detokenize(tokens[i:i + CHUNK_SIZE]))
+    for i in range(0, len(tokens), chunk_size - chunk_overlap):
+        chunks.append(detokenize(tokens[i:i + chunk_size]))
+    return chunks
+
+
+def markdown_blocks(text):
+    # A block is a run of non-blank lines: a paragraph, a whole list, or an
+    # exercise name followed by its sets. Headings are glued to the block after
+    # them, and every block remembers the heading path it sits under.
+    # A fenced code block stays inside one block: its "# comment" lines aren't
+    # headings and its blank lines don't end the block.
+    blocks = []
+    headings = []
+    current = []
+    starts_section = False
+    fence = None
+
+    def flush():
+        if current:
+            blocks.append({
+                "text": "\n".join(current),
+                "heading": " / ".join(h for _, h in headings),
+                "section": starts_section,
+            })
+
+    for line in text.splitlines():
+        if fence:
+            current.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+
+        match = HEADING_RE.match(line)
+        fence_match = FENCE_RE.match(line)
+        if fence_match:
+            fence = fence_match.group(1)
+            current.append(line)
+        elif match:
+            flush()
+            level = len(match.group(1))
+            headings = [(l, h) for l, h in headings if l < level] + [(level, match.group(2).strip())]
+            current, starts_section = [line], True
+        elif not line.strip():
+            # keep a heading attached to the paragraph below it
+            if current and not (len(current) == 1 and HEADING_RE.match(current[0])):
+                flush()
+                current, starts_section = [], False
+        else:
+            current.append(line)
+    flush()
+
+    return blocks
+
+
+def block_units(text):
+    # Lines of a block, except that a whole fenced code block is one unit
+    units = []
+    fence = None
+    for line in text.splitlines():
+        if fence:
+            units[-1] += "\n" + line
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        fence_match = FENCE_RE.match(line)
+        if fence_match:
+            fence = fence_match.group(1)
+        units.append(line)
+    return units
+
+
+def joined_tokens(parts, sep="\n\n"):
+    # Sizes are measured on the joined text, separators included
+    return len(tokenize(sep.join(parts)))
+
+
+def split_block(text, max_tokens):
+    # Oversized blocks are split on line boundaries (never inside a code fence
+    # that fits on its own), single huge lines on tokens
+    pieces = []
+    current = []
+    units = block_units(text)
+    while units:
+        line = units.pop(0)
+        if joined_tokens(current + [line], "\n") <= max_tokens:
+            current.append(line)
+            continue
+        if "\n" in line and len(tokenize(line)) > max_tokens:
+            # a fence too big for one chunk falls back to its own line boundaries
+            units[:0] = line.splitlines()
+            continue
+
+        lone_heading = len(current) == 1 and HEADING_RE.match(current[0])
+        if len(tokenize(line)) <= max_tokens and not lone_heading:
+            pieces.append("\n".join(current))
+            current = [line]
+            continue
+
+        # The first token cut fills the room left after the lines before it,
+        # so a heading line is never left behind as a chunk of its own.
+        # The last cut stays open for the lines that follow.
+        tokens = tokenize(line)
+        if current:
+            head = "\n".join(current) + "\n"
+            room = max_tokens - len(tokenize(head))
+            while room > 0 and len(tokenize(head + detokenize(tokens[:room]))) > max_tokens:
+                room -= 1
+            if room > 0:
+                pieces.append(head + detokenize(tokens[:room]))
+                tokens = tokens[room:]
+            else:
+                pieces.append("\n".join(current))
+            current = []
+        cuts = [detokenize(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+        pieces.extend(cuts[:-1])
+        current = cuts[-1:]
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def chunk_markdown(text, max_tokens=MD_MAX_TOKENS, min_tokens=MD_MIN_TOKENS):
+    chunks = []
+    current = []
+
+    for block in markdown_blocks(text):
+        heading = block["heading"]
+        # Pieces that may open a chunk get the heading path prepended, so they
+        # are cut small enough to take it without going over max_tokens
+        budget = max_tokens
+        if heading:
+            budget = max(max_tokens - joined_tokens([heading, ""]), max_tokens // 2)
+        limit = max_tokens if block["section"] else budget
+        pieces = [block["text"]] if joined_tokens([block["text"]]) <= limit else split_block(block["text"], budget)
+
+        for j, piece in enumerate(pieces):
+            new_section = block["section"] and j == 0
+            if current and (joined_tokens(current + [piece]) > max_tokens
+                            or (new_section and joined_tokens(current) >= min_tokens)):
+                chunks.append("\n\n".join(current))
+                current = []
+
+            # A section continued in a new chunk repeats its heading path for context
+            if (not current and not new_section and heading
+                    and joined_tokens([heading, piece]) <= max_tokens):
+                current.append(heading)
+
+            current.append(piece)
+
+    if current:
+        chunks.append("\n\n".join(current))
     return chunks
 
 
+# Recorded in the snapshot manifest and on every chunk, so an index built with
+# different chunking can be detected instead of silently mixed
+def chunker_config(name=CHUNKER, chunk_size=None, chunk_overlap=None):
+    if name == "markdown":
+        return {"name": "markdown", "max_tokens": chunk_size or MD_MAX_TOKENS, "min_tokens": MD_MIN_TOKENS}
+    if name == "fixed":
+        return {
+            "name": "fixed",
+            "chunk_size": chunk_size or CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap,
+        }
+    raise ValueError(f"Unknown chunker '{name}'")
+
+
+def chunker_id(chunker):
+    return "-".join(str(v) for v in chunker.values())
+
+
+def make_chunks(body, chunker):
+    if chunker["name"] == "markdown":
+        return chunk_markdown(body, chunker["max_tokens"], chunker["min_tokens"])
+    return chunk_text(body, chunker["chunk_size"], chunker["chunk_overlap"])
+
+
 def parse_markdown(path):
     with open(path, "r", encoding="utf-8") as f:
         content = f.read()
@@ -68,33 +249,13 @@ def parse_markdown(path):
 
 
 
-def embed(text):
-    res = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
-        json={"model": EMBED_MODEL, "prompt": text}
-    )
-    return res.json()["embedding"]
-
-
 # ---------------------------
 # INDEXING
 # ---------------------------
-def build_index():
-    vectors = []
+def collect_chunks(vault_path, chunker, existing_metadata):
     metadata = []
-    existing_metadata = {}
-    old_meta = []
-
-    if os.path.exists(META_PATH):
-        with open(META_PATH, "r") as f:
-            old_meta = json.load(f)
 
-    for m in old_meta:
-        key = (m["path"], m["chunk"])
-        existing_metadata[key] = m
-
-
-    for root, _, files in os.walk(VAULT_PATH):
+    for root, _, files in os.walk(vault_path):
         for file in files:
             if not file.endswith(".md"):
                 continue
@@ -105,12 +266,9 @@ def build_index():
             if not body:
                 continue
 
-            chunks = chunk_text(body)
+            chunks = make_chunks(body, chunker)
             for i, chunk in enumerate(chunks):
-                vector = embed(chunk)
-                vectors.append(vector)
-
-                rel_path = os.path.relpath(path, VAULT_PATH)
+                rel_path = os.path.relpath(path, vault_path)
                 key = (rel_path, i)
                 old = existing_metadata.get(key, {})
 
@@ -129,22 +287,51 @@ def build_index():
                 "split": old.get("split"),
                 })
 
+    return metadata
+
+
+def build_index(vault_path=VAULT_PATH, snapshot_dir=SNAPSHOT_DIR, embed_model=EMBED_MODEL, chunker=None):
+    chunker = chunker or chunker_config()
+    existing_metadata = {}
+    legacy_meta = META_PATH if snapshot_dir == SNAPSHOT_DIR else None
+    old_meta = load_metadata(snapshot_dir, legacy_meta=legacy_meta)
 
+    for m in old_meta:
+        key = (m["path"], m["chunk"])
+        existing_metadata[key] = m
 
-    if not vectors:
+    metadata = collect_chunks(vault_path, chunker, existing_metadata)
+    if not metadata:
         raise RuntimeError("No vectors generated. Check vault path or note contents.")
 
+    old = (read_manifest(snapshot_dir) or {}).get("provenance", {})
+    if old and (old.get("embed_model"), old.get("chunker")) != (embed_model, chunker):
+        print(f"Embedding config changed from {old.get('embed_model')} / {old.get('chunker')}, rebuilding everything.")
+
+    vectors = embed_many([m["text"] for m in metadata], embed_model)
+    for m in metadata:
+        # ---- Provenance ----
+        m["embed_model"] = embed_model
+        m["chunker"] = chunker_id(chunker)
+
     dim = len(vectors[0])
     index = faiss.IndexFlatL2(dim)
     index.add(np.array(vectors).astype("float32"))
 
-    faiss.write_index(index, FAISS_INDEX_PATH)
-
-    with open(META_PATH, "w") as f:
-        json.dump(metadata, f, indent=2)
+    version = write_snapshot(
+        snapshot_dir, index, metadata,
+        provenance={"embed_model": embed_model, "chunker": chunker}
+    )
 
-    print(f"Indexed {len(vectors)} chunks.")
+    print(f"Indexed {len(vectors)} chunks into snapshot v{version}.")
 
 if __name__ == "__main__":
-    build_index()
+    warm_up(embed_model=EMBED_MODEL, llm_model=None)
+
+    # python index_notes.py [shard] builds a shard registered in shards.json
+    if len(sys.argv) > 1:
+        cfg = shard_config(sys.argv[1], kind="notes")
+        build_index(cfg["vault"], cfg["snapshot_dir"])
+    else:
+        build_index()
 
@@ -1,4 +1,11 @@
+
 import os
+import json
+
+CACHE_PATH = "documents_listing.json"
+
+# path -> {"dirs": {dir: mtime}, "files": [...]}
+_cache = {}
 
 def list_dir(path):
     files = []
@@ -9,3 +16,82 @@ def list_dir(path):
                 files.append(full)
     return files
 
+
+def scan_dir(path):
+    # Returns None when path isn't a folder (e.g. an unmounted sync vault)
+    if not os.path.isdir(path):
+        return None
+
+    files = []
+    dirs = {}
+    stack = [path]
+    while stack:
+        root = stack.pop()
+        # Stat before listing: a file added in between bumps the mtime past the
+        # recorded one, so the listing that missed it doesn't look fresh
+        try:
+            mtime = os.stat(root).st_mtime
+            with os.scandir(root) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except (FileNotFoundError, NotADirectoryError):
+            # removed mid-scan, its parent's mtime already records that
+            if root == path:
+                return None
+            continue
+
+        dirs[root] = mtime
+        for e in entries:
+            if e.is_file() and e.name.endswith(".md"):
+                files.append(e.path)
+        stack.extend(e.path for e in reversed(entries) if e.is_dir(follow_symlinks=False))
+    return {"dirs": dirs, "files": files}
+
+
+def is_fresh(entry):
+    # Adding, removing or renaming a file or folder bumps its parent folder's
+    # mtime, so stat-ing the known folders is enough to detect a stale listing.
+    # An entry without folders never saw the root, so it is never fresh.
+    if not entry["dirs"]:
+        return False
+    for d, mtime in entry["dirs"].items():
+        try:
+            if os.stat(d).st_mtime != mtime:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def read_cache():
+    if not os.path.exists(CACHE_PATH):
+        return {}
+    try:
+        with open(CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_cache(cache):
+    tmp = f"{CACHE_PATH}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, CACHE_PATH)
+
+
+def list_dir_cached(path):
+    entry = _cache.get(path) or read_cache().get(path)
+    if entry and is_fresh(entry):
+        _cache[path] = entry
+        return entry["files"]
+
+    entry = scan_dir(path)
+    if entry is None:
+        # A missing folder isn't cached, so it is picked up as soon as it appears
+        _cache.pop(path, None)
+        return []
+    _cache[path] = entry
+    disk = read_cache()
+    disk[path] = entry
+    write_cache(disk)
+    return entry["files"]
@@ -0,0 +1,144 @@
+import sys
+import threading
+import faiss
+import numpy as np
+import index_notes
+from ollama_client import embed_many, warm_up
+from shards import shard_config
+from snapshots import load_metadata, read_manifest, write_snapshot
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+BATCH_SIZE = 32
+PROGRESS_INTERVAL = 5  # seconds between progress lines
+
+# The new vectors are built in memory (the shadow index) while the current
+# snapshot keeps serving queries. Only when every chunk is embedded is the
+# shadow written as a new snapshot, which swaps the manifest atomically.
+
+
+# ---------------------------
+# JOB
+# ---------------------------
+class MigrationJob(threading.Thread):
+    def __init__(self, vault_path, snapshot_dir, embed_model, chunker):
+        super().__init__(daemon=True)
+        self.vault_path = vault_path
+        self.snapshot_dir = snapshot_dir
+        self.embed_model = embed_model
+        self.chunker = chunker
+        self.done = 0
+        self.total = 0
+        self.version = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.version = self.migrate()
+        except Exception as e:
+            self.error = e
+
+    def current_metadata(self):
+        legacy_meta = index_notes.META_PATH if self.snapshot_dir == index_notes.SNAPSHOT_DIR else None
+        return load_metadata(self.snapshot_dir, legacy_meta=legacy_meta)
+
+    def migrate(self):
+        old = (read_manifest(self.snapshot_dir) or {}).get("provenance", {})
+
+        if old.get("chunker") == self.chunker:
+            # Same chunk boundaries, only the vectors change: re-embed stored texts
+            metadata = [dict(m) for m in self.current_metadata()]
+        else:
+            # Chunking changed (or is unknown), so chunks are rebuilt from the vault
+            existing = {(m["path"], m["chunk"]): m for m in self.current_metadata()}
+            metadata = index_notes.collect_chunks(self.vault_path, self.chunker, existing)
+
+        if not metadata:
+            raise RuntimeError("Nothing to migrate. Check vault path or note contents.")
+
+        self.total = len(metadata)
+        vectors = []
+        for start in range(0, self.total, BATCH_SIZE):
+            batch = metadata[start:start + BATCH_SIZE]
+            vectors.extend(embed_many([m["text"] for m in batch], self.embed_model))
+            self.done += len(batch)
+
+        # Enrichment written while the job ran (e.g. classify_workout_splits) is carried over,
+        # but only onto the same text: rebuilt chunk boundaries don't line up with the old ones
+        latest = {(m["path"], m["chunk"]): m for m in self.current_metadata()}
+        for m in metadata:
+            old = latest.get((m["path"], m["chunk"]))
+            m["split"] = old.get("split") if old and old.get("text") == m["text"] else None
+            m["embed_model"] = self.embed_model
+            m["chunker"] = index_notes.chunker_id(self.chunker)
+
+        index = faiss.IndexFlatL2(len(vectors[0]))
+        index.add(np.array(vectors).astype("float32"))
+
+        return write_snapshot(
+            self.snapshot_dir, index, metadata,
+            provenance={"embed_model": self.embed_model, "chunker": self.chunker}
+        )
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def parse_args(argv):
+    opts = {"shard": None, "embed_model": index_notes.EMBED_MODEL,
+            "chunker": index_notes.CHUNKER, "chunk_size": None, "chunk_overlap": None}
+    args = iter(argv)
+    for arg in args:
+        if arg == "--embed-model":
+            opts["embed_model"] = next(args)
+        elif arg == "--chunker":
+            opts["chunker"] = next(args)
+        elif arg == "--chunk-size":
+            opts["chunk_size"] = int(next(args))
+        elif arg == "--chunk-overlap":
+            opts["chunk_overlap"] = int(next(args))
+        else:
+            opts["shard"] = arg
+    return opts
+
+
+if __name__ == "__main__":
+    # python migrate_index.py [shard] [--embed-model NAME] [--chunker markdown|fixed]
+    #                         [--chunk-size N] [--chunk-overlap N]
+    opts = parse_args(sys.argv[1:])
+
+    if opts["shard"]:
+        cfg = shard_config(opts["shard"])
+        # Only notes are chunked, documents shards index one row per filename
+        if cfg.get("kind", "notes") != "notes":
+            print(f"{opts['shard']} is a {cfg['kind']} shard, migrate_index.py only handles notes shards. "
+                  f"Rebuild it with: python index_documents.py {opts['shard']}")
+            sys.exit(1)
+        vault_path, snapshot_dir = cfg["vault"], cfg["snapshot_dir"]
+    else:
+        vault_path, snapshot_dir = index_notes.VAULT_PATH, index_notes.SNAPSHOT_DIR
+
+    chunker = index_notes.chunker_config(opts["chunker"], opts["chunk_size"], opts["chunk_overlap"])
+    old = (read_manifest(snapshot_dir) or {}).get("provenance", {})
+    if (old.get("embed_model"), old.get("chunker")) == (opts["embed_model"], chunker):
+        print(f"{snapshot_dir} is already built with {opts['embed_model']} / {chunker}.")
+        sys.exit(0)
+
+    print(f"Migrating {snapshot_dir}: {old.get('embed_model')} / {old.get('chunker')} -> {opts['embed_model']} / {chunker}")
+    warm_up(embed_model=opts["embed_model"], llm_model=None)
+
+    job = MigrationJob(vault_path, snapshot_dir, opts["embed_model"], chunker)
+    job.start()
+    while job.is_alive():
+        job.join(PROGRESS_INTERVAL)
+        if job.total:
+            print(f"  embedded {job.done}/{job.total} chunks")
+
+    if job.error:
+        print(f"Migration failed, {snapshot_dir} still serves the old index: {job.error}")
+        sys.exit(1)
+
+    print(f"Swapped {snapshot_dir} to snapshot v{job.version}.")
+    if opts["embed_model"] != old.get("embed_model"):
+        print(f"Set EMBED_MODEL = \"{opts['embed_model']}\" in ask_notes.py and index_notes.py to query it.")
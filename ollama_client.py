@@ -0,0 +1,188 @@
+import asyncio
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+OLLAMA_URL = "http://localhost:11434"
+EMBED_MODEL = "nomic-embed-text"
+LLM_MODEL = "qwen2.5:3b-instruct"
+
+MAX_CONCURRENCY = 4        # in-flight requests to ollama at once
+POOL_SIZE = 8              # pooled HTTP connections
+CONNECT_TIMEOUT = 5        # seconds
+EMBED_TIMEOUT = 60         # seconds, covers a cold model load
+CHAT_TIMEOUT = 300         # seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5         # seconds, doubled every attempt
+BACKOFF_MAX = 10.0
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Both models stay loaded between calls so they don't evict each other
+# (ollama also needs OLLAMA_MAX_LOADED_MODELS >= 2 for that).
+EMBED_KEEP_ALIVE = "30m"
+LLM_KEEP_ALIVE = "30m"
+
+
+class OllamaError(RuntimeError):
+    pass
+
+
+# ---------------------------
+# CLIENT
+# ---------------------------
+class OllamaClient:
+    def __init__(self, base_url=OLLAMA_URL, max_concurrency=MAX_CONCURRENCY,
+                 max_retries=MAX_RETRIES):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    async def post(self, endpoint, payload, timeout, retry_read_timeout=True):
+        url = f"{self.base_url}{endpoint}"
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+            try:
+                async with self.semaphore:
+                    res = await asyncio.to_thread(
+                        self.session.post,
+                        url,
+                        json=payload,
+                        timeout=(CONNECT_TIMEOUT, timeout),
+                    )
+            except requests.ReadTimeout as e:
+                # ollama keeps generating for an abandoned request, so a retry
+                # would only queue a duplicate generation behind it
+                if not retry_read_timeout:
+                    raise OllamaError(f"{endpoint} timed out after {timeout}s") from e
+                error = e
+                continue
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+
+            if res.status_code in RETRY_STATUS:
+                error = f"HTTP {res.status_code}: {res.text.strip()}"
+                continue
+            if res.status_code >= 400:
+                raise OllamaError(f"{endpoint} returned HTTP {res.status_code}: {res.text.strip()}")
+
+            try:
+                return res.json()
+            except ValueError:
+                error = f"invalid JSON response: {res.text[:200]!r}"
+
+        raise OllamaError(f"{endpoint} failed after {self.max_retries + 1} attempts: {error}")
+
+    async def embed(self, text, model=EMBED_MODEL):
+        data = await self.post(
+            "/api/embeddings",
+            {"model": model, "prompt": text, "keep_alive": EMBED_KEEP_ALIVE},
+            EMBED_TIMEOUT,
+        )
+        if "embedding" not in data:
+            raise OllamaError(f"No embedding in response: {data.get('error', data)}")
+        return data["embedding"]
+
+    async def embed_many(self, texts, model=EMBED_MODEL):
+        # Concurrency is bounded by the semaphore, order is preserved
+        return await asyncio.gather(*(self.embed(t, model) for t in texts))
+
+    async def chat(self, prompt, model=LLM_MODEL):
+        data = await self.post(
+            "/api/generate",
+            {"model": model, "prompt": prompt, "stream": False, "keep_alive": LLM_KEEP_ALIVE},
+            CHAT_TIMEOUT,
+            retry_read_timeout=False,
+        )
+        if "response" not in data:
+            raise OllamaError(f"No response in reply: {data.get('error', data)}")
+        return data["response"]
+
+    async def load(self, model, keep_alive):
+        # A request without a prompt only loads the model into memory
+        await self.post(
+            "/api/generate",
+            {"model": model, "keep_alive": keep_alive},
+            CHAT_TIMEOUT,
+            retry_read_timeout=False,
+        )
+
+    async def warm_up(self, embed_model=EMBED_MODEL, llm_model=LLM_MODEL):
+        tasks = []
+        if embed_model:
+            tasks.append(self.embed("warm up", embed_model))
+        if llm_model:
+            tasks.append(self.load(llm_model, LLM_KEEP_ALIVE))
+        await asyncio.gather(*tasks)
+
+
+# ---------------------------
+# SYNC HELPERS
+# ---------------------------
+# Scripts are synchronous, so all coroutines run on one background event loop.
+# Sharing the loop keeps a single client, connection pool and semaphore per process.
+_loop = None
+_client = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+    return _loop
+
+
+def get_client():
+    global _client
+    loop = get_loop()
+    with _lock:
+        if _client is None:
+            _client = asyncio.run_coroutine_threadsafe(_make_client(), loop).result()
+    return _client
+
+
+async def _make_client():
+    # Created on the background loop so the semaphore binds to it
+    return OllamaClient()
+
+
+def submit(coro):
+    # Starts the request right away and returns a concurrent.futures.Future
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro):
+    return submit(coro).result()
+
+
+def embed(text, model=EMBED_MODEL):
+    return run(get_client().embed(text, model))
+
+
+def embed_many(texts, model=EMBED_MODEL):
+    return run(get_client().embed_many(texts, model))
+
+
+def chat(prompt, model=LLM_MODEL):
+    return run(get_client().chat(prompt, model))
+
+
+def warm_up(embed_model=EMBED_MODEL, llm_model=LLM_MODEL):
+    run(get_client().warm_up(embed_model, llm_model))
@@ -0,0 +1,91 @@
+import re
+import math
+import numpy as np
+from datetime import date
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+W_COSINE = 0.7
+W_LEXICAL = 0.2
+W_RECENCY = 0.1
+RECENCY_HALF_LIFE_DAYS = 90
+MMR_LAMBDA = 0.7           # 1.0 = pure relevance, lower = more diverse
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "did", "do", "for", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "to", "was", "what",
+    "when", "which", "who", "with",
+}
+
+
+# ---------------------------
+# FEATURES
+# ---------------------------
+def terms(text):
+    return {t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS}
+
+
+def lexical_overlap(query_terms, text):
+    if not query_terms:
+        return 0.0
+    return len(query_terms & terms(text)) / len(query_terms)
+
+
+def recency(value, today):
+    if not value:
+        return 0.0
+    try:
+        age = (today - date.fromisoformat(str(value)[:10])).days
+    except ValueError:
+        return 0.0
+    return math.exp(-math.log(2) * max(age, 0) / RECENCY_HALF_LIFE_DAYS)
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# ---------------------------
+# RERANK
+# ---------------------------
+# Re-orders over-fetched candidates (stored vectors + their metadata rows) and
+# returns the positions of the best k, most relevant first.
+# Relevance mixes exact cosine on the stored vectors, lexical overlap with the
+# question and recency of the note's date; MMR then drops near-duplicates.
+def rerank(question, q_vec, vectors, rows, k, today=None):
+    if not rows:
+        return []
+
+    today = today or date.today()
+    query_terms = terms(question)
+
+    vectors = normalize(np.array(vectors, dtype="float32"))
+    cosines = vectors @ normalize(np.asarray(q_vec, dtype="float32"))
+
+    relevance = []
+    for m, cosine in zip(rows, cosines):
+        relevance.append(
+            W_COSINE * float(cosine)
+            + W_LEXICAL * lexical_overlap(query_terms, m.get("text", ""))
+            + W_RECENCY * recency(m.get("date"), today)
+        )
+    relevance = np.array(relevance)
+
+    # ---- MMR selection ----
+    similarity = vectors @ vectors.T
+    selected = []
+    remaining = list(range(len(rows)))
+
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        mmr = MMR_LAMBDA * relevance[remaining] - (1 - MMR_LAMBDA) * redundancy
+        best = remaining[int(np.argmax(mmr))]
+        selected.append(best)
+        remaining.remove(best)
+
+    return selected
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import heapq
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from snapshots import IndexMismatchError, check_provenance, load_snapshot, read_manifest
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+REGISTRY_PATH = "shards.json"
+MAX_WORKERS = 4
+
+# shards.json maps a shard name to its vault and snapshot folder, e.g.
+# {
+#   "ethan-2025": {"kind": "notes", "vault": "/path/to/vault", "snapshot_dir": "snapshots/ethan-2025"},
+#   "docs": {"kind": "documents", "vault": "/path/to/docs", "snapshot_dir": "snapshots/docs"}
+# }
+
+
+# ---------------------------
+# REGISTRY
+# ---------------------------
+def load_registry():
+    if not os.path.exists(REGISTRY_PATH):
+        return {}
+    with open(REGISTRY_PATH, "r") as f:
+        return json.load(f)
+
+
+def save_registry(registry):
+    tmp = f"{REGISTRY_PATH}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, REGISTRY_PATH)
+
+
+def register(name, vault, kind="notes", snapshot_dir=None):
+    registry = load_registry()
+    registry[name] = {
+        "kind": kind,
+        "vault": vault,
+        "snapshot_dir": snapshot_dir or os.path.join("snapshots", name),
+    }
+    save_registry(registry)
+    return registry[name]
+
+
+def unregister(name):
+    registry = load_registry()
+    registry.pop(name, None)
+    save_registry(registry)
+
+
+def shard_config(name, kind=None):
+    registry = load_registry()
+    if name not in registry:
+        raise KeyError(f"Unknown shard '{name}'. Registered: {', '.join(registry) or 'none'}")
+    # Notes and documents snapshots hold different rows, so a build must not cross kinds
+    shard_kind = registry[name].get("kind", "notes")
+    if kind and shard_kind != kind:
+        raise ValueError(f"Shard '{name}' is a {shard_kind} shard, this script only handles {kind} shards")
+    return registry[name]
+
+
+# ---------------------------
+# SHARDS
+# ---------------------------
+class Hit:
+    # Keeps the index and metadata row it was found in, so a refresh that swaps
+    # the shard's snapshot afterwards can't pair this row with another build
+    def __init__(self, distance, shard, row, index, meta):
+        self.distance = distance
+        self.shard = shard
+        self.row = row
+        self.index = index
+        self.meta = meta
+
+    def vector(self):
+        return self.index.reconstruct(self.row)
+
+
+class Shard:
+    def __init__(self, name, snapshot_dir, legacy_index=None, legacy_meta=None, embed_model=None,
+                 vault=None):
+        self.name = name
+        self.snapshot_dir = snapshot_dir
+        self.vault = vault  # metadata paths are relative to it
+        self.legacy_index = legacy_index
+        self.legacy_meta = legacy_meta
+        self.embed_model = embed_model
+        # (index, metadata) is swapped in one assignment so readers never see a mixed pair
+        self.snapshot = (None, [])
+        self.version = None
+        self.rejected_version = None
+
+    def load(self):
+        index, metadata, manifest = load_snapshot(
+            self.snapshot_dir, self.legacy_index, self.legacy_meta
+        )
+        if self.embed_model:
+            check_provenance(manifest, self.embed_model)
+        self.snapshot = (index, metadata)
+        self.version = manifest["version"] if manifest else None
+
+    @property
+    def index(self):
+        return self.snapshot[0]
+
+    @property
+    def metadata(self):
+        return self.snapshot[1]
+
+    def refresh(self):
+        # Cheap manifest read, the snapshot itself is only reopened after a rebuild
+        manifest = read_manifest(self.snapshot_dir)
+        if not manifest or manifest["version"] in (self.version, self.rejected_version):
+            return
+        try:
+            self.load()
+        except IndexMismatchError as e:
+            # A migration swapped in vectors from another model: keep serving the
+            # snapshot already in memory until EMBED_MODEL is updated
+            print(f"Keeping shard {self.name} at v{self.version}: {e}")
+            self.rejected_version = manifest["version"]
+
+    def search(self, q_vec, k, doc_type=None):
+        index, metadata = self.snapshot
+        if index is None or index.ntotal == 0:
+            return []
+        if q_vec.shape[1] != index.d:
+            raise IndexMismatchError(
+                f"Shard {self.name} holds {index.d}-d vectors but the query is {q_vec.shape[1]}-d"
+            )
+        D, I = index.search(q_vec, min(k, index.ntotal))
+        return [
+            Hit(float(d), self, int(i), index, metadata[i])
+            for d, i in zip(D[0], I[0])
+            if i >= 0 and (doc_type is None or metadata[i].get("type") == doc_type)
+        ]
+
+
+class ShardSet:
+    def __init__(self, max_workers=MAX_WORKERS, embed_model=None):
+        self.embed_model = embed_model
+        self.shards = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    @classmethod
+    def from_registry(cls, kind="notes", embed_model=None):
+        shard_set = cls(embed_model=embed_model)
+        for name, cfg in load_registry().items():
+            if cfg.get("kind", "notes") != kind:
+                continue
+            try:
+                shard_set.load(name, cfg["snapshot_dir"], vault=cfg["vault"])
+            except FileNotFoundError:
+                print(f"Shard {name} has no snapshot yet, skipping it")
+            except IndexMismatchError as e:
+                # One migrated shard must not take every other shard down with it
+                print(f"Skipping shard {name}: {e}")
+        return shard_set
+
+    def load(self, name, snapshot_dir, legacy_index=None, legacy_meta=None, vault=None):
+        shard = Shard(name, snapshot_dir, legacy_index, legacy_meta, self.embed_model, vault)
+        shard.load()
+        with self.lock:
+            self.shards[name] = shard
+        return shard
+
+    def unload(self, name):
+        with self.lock:
+            self.shards.pop(name, None)
+
+    def loaded(self):
+        with self.lock:
+            return list(self.shards.values())
+
+    def refresh(self):
+        for shard in self.loaded():
+            shard.refresh()
+
+    def metadata(self):
+        rows = []
+        for shard in self.loaded():
+            rows.extend(shard.metadata)
+        return rows
+
+    def search(self, q_vec, k, doc_type=None):
+        # Every shard is searched in parallel (faiss releases the GIL), then the
+        # per-shard top-k lists are merged by L2 distance into one global top-k
+        q_vec = np.array([q_vec]).astype("float32")
+        futures = [
+            self.pool.submit(shard.search, q_vec, k, doc_type)
+            for shard in self.loaded()
+        ]
+        hits = [hit for f in futures for hit in f.result()]
+        return heapq.nsmallest(k, hits, key=lambda h: h.distance)
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    if args[:1] == ["add"] and len(args) >= 3:
+        kind = args[3] if len(args) > 3 else "notes"
+        cfg = register(args[1], args[2], kind=kind)
+        print(f"Registered {args[1]} -> {cfg['snapshot_dir']}")
+        print(f"Build it with: python index_{'documents' if kind == 'documents' else 'notes'}.py {args[1]}")
+    elif args[:1] == ["remove"] and len(args) == 2:
+        unregister(args[1])
+        print(f"Removed {args[1]} (snapshot folder left on disk)")
+    elif args[:1] == ["list"] or not args:
+        for name, cfg in load_registry().items():
+            print(f"{name} [{cfg.get('kind', 'notes')}] {cfg['vault']} -> {cfg['snapshot_dir']}")
+    else:
+        print("Usage: python shards.py [list | add NAME VAULT_PATH [notes|documents] | remove NAME]")
@@ -0,0 +1,267 @@
+import os
+import json
+import fcntl
+import shutil
+import time
+import tempfile
+from contextlib import contextmanager
+import faiss
+from datetime import datetime
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+MANIFEST_NAME = "MANIFEST.json"
+INDEX_NAME = "index.faiss"
+META_NAME = "metadata.json"
+LOCK_NAME = ".writer.lock"
+KEEP_SNAPSHOTS = 3
+STALE_TMP_SECONDS = 24 * 60 * 60  # temp files older than this belong to a crashed writer
+
+# Layout of a snapshot root:
+#   <root>/MANIFEST.json   -> {"version": 4, "snapshot": "v000004", ...}
+#   <root>/v000003/        -> index.faiss + metadata.json (immutable once renamed)
+#   <root>/v000004/
+# The manifest also records provenance: embedding model, vector dimension and
+# chunker config, so vectors from different models are never mixed silently.
+# Writers build a temp dir, fsync it, rename it to the next version and only then
+# swap the manifest with os.replace. That swap is serialized between writers by a
+# lock file so a slower writer can't roll the manifest back; readers take no lock.
+# Readers resolve the manifest once and open that directory, so they never see
+# an index/metadata pair from different builds.
+
+
+class IndexMismatchError(RuntimeError):
+    pass
+
+
+class StaleSnapshotError(RuntimeError):
+    pass
+
+
+# ---------------------------
+# UTILS
+# ---------------------------
+def fsync_file(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def snapshot_name(version):
+    return f"v{version:06d}"
+
+
+def list_versions(root):
+    if not os.path.isdir(root):
+        return []
+    versions = []
+    for name in os.listdir(root):
+        if name.startswith("v") and name[1:].isdigit():
+            versions.append(int(name[1:]))
+    return sorted(versions)
+
+
+def current_version(root):
+    manifest = read_manifest(root)
+    return manifest["version"] if manifest else 0
+
+
+def read_manifest(root):
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+@contextmanager
+def writer_lock(root):
+    # Exclusive flock on <root>/.writer.lock, released when the with block ends
+    fd = os.open(os.path.join(root, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def write_manifest(root, manifest):
+    fd, tmp = tempfile.mkstemp(prefix=".manifest-", dir=root)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(root, MANIFEST_NAME))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    fsync_dir(root)
+
+
+# ---------------------------
+# WRITE
+# ---------------------------
+# base_version is the manifest version the caller's data was loaded from (0 when
+# there was none). If another writer swapped the manifest in the meantime the
+# write is refused with StaleSnapshotError instead of silently undoing that build.
+def write_snapshot(root, index, metadata, keep=KEEP_SNAPSHOTS, provenance=None, base_version=None):
+    if index.ntotal != len(metadata):
+        raise ValueError(f"Index has {index.ntotal} rows but metadata has {len(metadata)}")
+    check_base_version(root, base_version)
+
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=root)
+
+    try:
+        index_path = os.path.join(tmp_dir, INDEX_NAME)
+        faiss.write_index(index, index_path)
+        fsync_file(index_path)
+
+        with open(os.path.join(tmp_dir, META_NAME), "w") as f:
+            json.dump(metadata, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        fsync_dir(tmp_dir)
+
+        # rename fails if another writer already took this version, so try the next one
+        versions = list_versions(root)
+        version = versions[-1] + 1 if versions else 1
+        while True:
+            try:
+                os.rename(tmp_dir, os.path.join(root, snapshot_name(version)))
+                break
+            except OSError:
+                if not os.path.exists(os.path.join(root, snapshot_name(version))):
+                    raise
+                version += 1
+        fsync_dir(root)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # Check and swap happen under the writer lock, so no other writer can pin a
+    # version in between. A write that lost the race is refused, not reported as pinned.
+    with writer_lock(root):
+        try:
+            check_base_version(root, base_version)
+            current = read_manifest(root)
+            if current is not None and current["version"] > version:
+                raise StaleSnapshotError(
+                    f"{root} already pins v{current['version']}, newer than this snapshot v{version}"
+                )
+        except StaleSnapshotError:
+            shutil.rmtree(os.path.join(root, snapshot_name(version)), ignore_errors=True)
+            raise
+
+        write_manifest(root, {
+            "version": version,
+            "snapshot": snapshot_name(version),
+            "index": INDEX_NAME,
+            "metadata": META_NAME,
+            "rows": len(metadata),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "provenance": dict(provenance or {}, dim=index.d),
+        })
+
+    gc_snapshots(root, keep)
+    return version
+
+
+def check_base_version(root, base_version):
+    if base_version is None:
+        return
+    current = current_version(root)
+    if current != base_version:
+        raise StaleSnapshotError(
+            f"{root} moved from v{base_version} to v{current} while this snapshot was prepared"
+        )
+
+
+def gc_snapshots(root, keep=KEEP_SNAPSHOTS):
+    manifest = read_manifest(root)
+    pinned = manifest["snapshot"] if manifest else None
+
+    # Never remove the pinned snapshot, and keep a few older ones so readers
+    # that resolved the previous manifest can still finish opening it
+    for version in list_versions(root)[:-keep]:
+        name = snapshot_name(version)
+        if name != pinned:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    # Writers clean up their own temp files, so only old ones are crash leftovers.
+    # Younger ones may belong to a writer that is still running.
+    now = time.time()
+    for name in os.listdir(root):
+        if not (name.startswith(".tmp-") or name.startswith(".manifest-")):
+            continue
+        path = os.path.join(root, name)
+        try:
+            if now - os.stat(path).st_mtime < STALE_TMP_SECONDS:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# ---------------------------
+# READ
+# ---------------------------
+def check_provenance(manifest, embed_model):
+    provenance = (manifest or {}).get("provenance", {})
+    built_with = provenance.get("embed_model")
+    # Snapshots from before provenance was recorded can't be checked
+    if built_with and built_with != embed_model:
+        raise IndexMismatchError(
+            f"Index {manifest['snapshot']} was embedded with '{built_with}' but queries use "
+            f"'{embed_model}'. Change EMBED_MODEL or run migrate_index.py."
+        )
+
+
+# Returns the manifest it opened alongside the data (None for legacy files), so
+# callers check provenance against the build they loaded rather than re-reading it.
+def load_snapshot(root, legacy_index=None, legacy_meta=None):
+    manifest = read_manifest(root)
+
+    if manifest is None:
+        # Pre-snapshot layout: a single index + metadata pair written in place
+        if legacy_index and legacy_meta and os.path.exists(legacy_index):
+            index = faiss.read_index(legacy_index)
+            with open(legacy_meta, "r") as f:
+                metadata = json.load(f)
+            return index, metadata, None
+        raise FileNotFoundError(f"No snapshot in {root}. Build the index first.")
+
+    snapshot_dir = os.path.join(root, manifest["snapshot"])
+    index = faiss.read_index(os.path.join(snapshot_dir, manifest["index"]))
+    with open(os.path.join(snapshot_dir, manifest["metadata"]), "r") as f:
+        metadata = json.load(f)
+
+    if index.ntotal != len(metadata):
+        raise RuntimeError(f"Snapshot {manifest['snapshot']} is inconsistent: "
+                           f"{index.ntotal} vectors vs {len(metadata)} metadata rows")
+    return index, metadata, manifest
+
+
+def load_metadata(root, legacy_meta=None):
+    manifest = read_manifest(root)
+    if manifest is None:
+        if legacy_meta and os.path.exists(legacy_meta):
+            with open(legacy_meta, "r") as f:
+                return json.load(f)
+        return []
+
+    with open(os.path.join(root, manifest["snapshot"], manifest["metadata"]), "r") as f:
+        return json.load(f)